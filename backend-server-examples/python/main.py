@@ -3,13 +3,28 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
+import dataclasses
+import logging
 import os
-from typing import Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, status, Request, Header
-from fastapi.responses import JSONResponse
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+from http.cookiejar import DefaultCookiePolicy
+from types import SimpleNamespace
+from typing import Optional, Dict, Any, Awaitable, Callable, NamedTuple, Tuple
+from fastapi import APIRouter, FastAPI, HTTPException, status, Request, Header, Depends
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import msgspec
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
 import uvicorn
+from uvicorn.logging import DefaultFormatter
 
 from dcid_server_sdk import (
     DCIDServerSDK,
@@ -32,96 +47,342 @@ from dcid_server_sdk import (
     AuthenticationError,
     ServerError,
 )
+from dcid_server_sdk.config import get_environment_config
 from dcid_server_sdk.modules.analytics.types import StartSessionEvent, EndSessionEvent
+from dcid_server_sdk.utils import http as sdk_http
+from dcid_server_sdk.utils.logger import ConsoleLogger, NoOpLogger
+
+logger = logging.getLogger("dcid.errors")
+analytics_logger = logging.getLogger("dcid.analytics")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson instead of the stdlib json module"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class AllowAllCORSMiddleware:
+    """
+    CORS middleware that allows every origin, method and header
+
+    Equivalent to Starlette's CORSMiddleware configured with "*" everywhere and
+    credentials allowed, without its per-request origin/method/header matching.
+    Requests without an Origin header (server-to-server calls) pass straight through.
+    """
+
+    ALLOW_METHODS = b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = request_method = request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
 
-app = FastAPI(title="DCID Server SDK Test Server", version="0.1.0")
+        # Credentials are allowed, so the origin must be echoed back instead of "*"
+        cors_headers = [
+            (b"access-control-allow-origin", origin),
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin"),
+        ]
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            headers = [
+                *cors_headers,
+                (b"access-control-allow-methods", self.ALLOW_METHODS),
+                (b"access-control-max-age", b"600"),
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", b"2"),
+            ]
+            if request_headers is not None:
+                headers.append((b"access-control-allow-headers", request_headers))
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": b"OK"})
+            return
+
+        async def send_with_cors(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *cors_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+# The SDK calls requests.request() directly, which opens a new connection (and
+# TLS handshake) for every call. Route those calls through one shared Session so
+# connections to the DCID backend are kept alive and reused. urllib3 pools them
+# per scheme/host/port; the pool size covers asyncio.to_thread's default executor.
+http_session = requests.Session()
+http_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))  # never share cookies between users
+_http_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+http_session.mount("https://", _http_adapter)
+http_session.mount("http://", _http_adapter)
+sdk_http.requests = SimpleNamespace(request=http_session.request, exceptions=requests.exceptions)
+
+
+class ServerConfig(NamedTuple):
+    """Server configuration, read from the environment once at startup"""
+
+    api_key: str
+    environment: str
+    timeout: int  # milliseconds
+    python_env: Optional[str]
+    log_level: str
+
+
+def load_config() -> ServerConfig:
+    """Read the server configuration from environment variables"""
+    api_key = os.getenv("DCID_API_KEY")
+    if not api_key:
+        raise RuntimeError("DCID_API_KEY environment variable is required")
+
+    return ServerConfig(
+        api_key=api_key,
+        environment=os.getenv("DCID_ENVIRONMENT", "dev"),
+        # Use longer timeout (2 min) for credential operations which may involve blockchain
+        timeout=120000,
+        python_env=os.getenv("PYTHON_ENV"),
+        log_level=os.getenv("LOG_LEVEL", "warning").upper(),
+    )
+
+
+config = load_config()
+
+
+def configure_logging() -> None:
+    """Send this server's "dcid.*" loggers to stderr in Uvicorn's format"""
+    # Done at import time so LOG_LEVEL applies however the app is started
+    # (python main.py, uvicorn main:app or Gunicorn workers)
+    dcid_logger = logging.getLogger("dcid")
+    dcid_logger.setLevel(config.log_level)
+    if not dcid_logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(DefaultFormatter("%(levelprefix)s %(message)s"))
+        dcid_logger.addHandler(handler)
+        dcid_logger.propagate = False
+
+
+configure_logging()
+
+
+class SDKConsoleLogger(ConsoleLogger):
+    """SDK console logger that checks PYTHON_ENV once instead of on every debug call"""
+
+    def __init__(self, debug_enabled: bool):
+        super().__init__(True)
+        self.debug_enabled = debug_enabled
+
+    def debug(self, message: str, meta: Optional[Any] = None) -> None:
+        if self.debug_enabled:
+            self.logger.debug(f"{message} {meta}" if meta else message)
+
+
+# Bearer token of the request being handled. Each request runs in its own
+# context and asyncio.to_thread copies it into the worker thread.
+_auth_token: ContextVar[Optional[str]] = ContextVar("auth_token", default=None)
+
+
+def create_sdk() -> DCIDServerSDK:
+    """Create the SDK client used by the route handlers"""
+    # Same logging as the SDK's default (console in dev, silent in prod)
+    sdk_logger = (
+        SDKConsoleLogger(debug_enabled=config.python_env != "production")
+        if config.environment == "dev"
+        else NoOpLogger()
+    )
+    sdk = DCIDServerSDK(
+        api_key=config.api_key,
+        environment=config.environment,
+        timeout=config.timeout,
+        enable_request_logging=True,
+        logger=sdk_logger,
+    )
+
+    # All identity modules share one authenticated HTTP client. It only sends the
+    # bearer token of the current request: requests without one go out
+    # unauthenticated instead of using the token of whoever signed in last.
+    # Automatic refresh is disabled because it uses the SDK-wide refresh token,
+    # which belongs to the last user who signed in. An expired token is returned
+    # to the caller as a 401 so the client can refresh it with its own token.
+    identity_http_client = sdk.identity.encryption.http_client
+    identity_http_client.get_auth_token = _auth_token.get
+    identity_http_client.get_refresh_token = None
+    return sdk
+
+
+def warm_up_connection() -> None:
+    """Open a pooled connection to the DCID backend so the first request skips the handshake"""
+    try:
+        http_session.head(get_environment_config(config.environment).base_url, timeout=5)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Could not warm up connection to DCID backend: %s", e)
+
+
+# End-session events are fire-and-forget for clients, so they are queued and
+# sent in the background. They run on their own small thread pool, so a slow
+# analytics backend never takes threads from the default executor that the
+# identity and auth routes use.
+ANALYTICS_QUEUE_SIZE = 10000
+ANALYTICS_BATCH_SIZE = 16
+ANALYTICS_MAX_THREADS = 4
+ANALYTICS_FLUSH_INTERVAL = 0.05  # seconds to wait for more events before sending a batch
+
+
+async def drain_analytics_events(
+    queue: "asyncio.Queue[EndSessionEvent]",
+    sdk: DCIDServerSDK,
+    executor: ThreadPoolExecutor,
+) -> None:
+    """Send queued end-session events to the DCID backend in batches"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        await asyncio.sleep(ANALYTICS_FLUSH_INTERVAL)
+        while len(batch) < ANALYTICS_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+
+        # The SDK has no batch endpoint, so send the batch's events concurrently
+        results = await asyncio.gather(
+            *(loop.run_in_executor(executor, sdk.analytics.end_session, event) for event in batch),
+            return_exceptions=True,
+        )
+        for event, result in zip(batch, results):
+            if isinstance(result, Exception):
+                analytics_logger.warning("Failed to send end_session for %s: %s", event.session_id, result)
+            queue.task_done()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.sdk = create_sdk()
+    app.state.analytics_queue = asyncio.Queue(maxsize=ANALYTICS_QUEUE_SIZE)
+    analytics_executor = ThreadPoolExecutor(ANALYTICS_MAX_THREADS, thread_name_prefix="dcid-analytics")
+    drainer = asyncio.create_task(
+        drain_analytics_events(app.state.analytics_queue, app.state.sdk, analytics_executor)
+    )
+    await asyncio.to_thread(warm_up_connection)
+    yield
+    try:
+        await asyncio.wait_for(app.state.analytics_queue.join(), timeout=10)
+    except asyncio.TimeoutError:
+        analytics_logger.warning("Dropping %d unsent analytics events", app.state.analytics_queue.qsize())
+    drainer.cancel()
+    analytics_executor.shutdown(wait=False, cancel_futures=True)
+    http_session.close()
+
+
+app = FastAPI(
+    title="DCID Server SDK Test Server",
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
-# Initialize SDK
-api_key = os.getenv("DCID_API_KEY")
-if not api_key:
-    raise RuntimeError("DCID_API_KEY environment variable is required")
+# Add CORS middleware
+app.add_middleware(AllowAllCORSMiddleware)
+
 
-environment = os.getenv("DCID_ENVIRONMENT", "dev")
-# Use longer timeout (2 min) for credential operations which may involve blockchain
-sdk = DCIDServerSDK(api_key=api_key, environment=environment, timeout=120000, enable_request_logging=True)
+async def get_sdk(request: Request) -> DCIDServerSDK:
+    """Dependency returning the SDK client created at startup"""
+    return request.app.state.sdk
 
 
-def set_auth_from_request(authorization: Optional[str] = None):
-    """Extract and set auth token from request header"""
+async def set_auth_from_request(authorization: Optional[str] = Header(None)):
+    """Dependency that extracts the auth token from the request header for the current request"""
+    # Must stay async: sync dependencies run in a thread with a copy of the
+    # context, so the token would never reach the route handler
     if authorization and authorization.startswith("Bearer "):
-        token = authorization[7:]
-        sdk.set_auth_token(token)
+        _auth_token.set(authorization.removeprefix("Bearer "))
+
+
+def to_camel(name: str) -> str:
+    """Convert a snake_case field name to the camelCase key used by the API"""
+    first, *rest = name.split("_")
+    return first + "".join(part.capitalize() for part in rest)
+
+
+class CamelModel(BaseModel):
+    """Request body model whose fields are read from camelCase JSON keys"""
+
+    model_config = ConfigDict(alias_generator=to_camel)
 
 
 # Pydantic models for request bodies
-class RegisterOTPRequest(BaseModel):
+class RegisterOTPRequest(CamelModel):
     email: Optional[str] = None
     phone: Optional[str] = None
 
 
-class ConfirmOTPRequest(BaseModel):
+class ConfirmOTPRequest(CamelModel):
     email: Optional[str] = None
     phone: Optional[str] = None
     otp: str
 
 
-class RefreshTokenRequest(BaseModel):
-    refresh_token: str = Field(..., alias="refreshToken")
+class RefreshTokenRequest(CamelModel):
+    refresh_token: str
 
 
-class GenerateEncryptionKeyRequest(BaseModel):
+class GenerateEncryptionKeyRequest(CamelModel):
     did: str
-    owner_email: str = Field(..., alias="ownerEmail")
+    owner_email: str
 
 
-class GetEncryptedKeyRequest(BaseModel):
+class GetEncryptedKeyRequest(CamelModel):
     did: str
 
 
-class IssueCredentialRequest(BaseModel):
+class IssueCredentialRequest(CamelModel):
     did: str
-    credential_name: str = Field(..., alias="credentialName")
+    credential_name: str
     values: Dict[str, Any]
-    owner_email: str = Field(..., alias="ownerEmail")
+    owner_email: str
 
 
-class GetCredentialOfferQuery(BaseModel):
-    claim_id: str = Field(..., alias="claimId")
-    tx_id: str = Field(..., alias="txId")
+class GetCredentialOfferQuery(CamelModel):
+    claim_id: str
+    tx_id: str
 
 
-class StoreCredentialRequest(BaseModel):
+class StoreCredentialRequest(CamelModel):
     did: str
-    credential_type: str = Field(..., alias="credentialType")
+    credential_type: str
     credential: Any
     encrypted: bool = True
 
 
-class RetrieveUserCredentialRequest(BaseModel):
+class RetrieveUserCredentialRequest(CamelModel):
     did: str
-    credential_type: str = Field(..., alias="credentialType")
-    include_cid_only: bool = Field(False, alias="includeCidOnly")
+    credential_type: str
+    include_cid_only: bool = False
 
 
-class GetAllUserCredentialsRequest(BaseModel):
+class GetAllUserCredentialsRequest(CamelModel):
     did: str
-    include_credential_data: bool = Field(False, alias="includeCredentialData")
+    include_credential_data: bool = False
 
 
-class VerifySignInRequest(BaseModel):
-    credential_name: str = Field(..., alias="credentialName")
+class VerifySignInRequest(CamelModel):
+    credential_name: str
 
 
-class PostLinkStoreRequest(BaseModel):
+class PostLinkStoreRequest(CamelModel):
     id: str
     thid: str
     type: str
@@ -130,431 +391,476 @@ class PostLinkStoreRequest(BaseModel):
     body: Dict[str, Any]
 
 
-class GetLinkStoreQuery(BaseModel):
+class GetLinkStoreQuery(CamelModel):
     id: str
 
 
-class VerifyCallbackRequest(BaseModel):
+class VerifyCallbackRequest(CamelModel):
     token: str
 
 
-class StartSessionRequest(BaseModel):
-    user_id: Optional[str] = Field(None, alias="userId")
-    anonymous_id: Optional[str] = Field(None, alias="anonymousId")
-    page_location: Optional[str] = Field(None, alias="pageLocation")
-    session_id: Optional[str] = Field(None, alias="sessionId")
+# Analytics bodies are decoded with msgspec: these are the highest-rate
+# endpoints and their schemas are flat optional strings
+class StartSessionBody(msgspec.Struct, rename="camel"):
+    user_id: Optional[str] = None
+    anonymous_id: Optional[str] = None
+    page_location: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+class EndSessionBody(msgspec.Struct, rename="camel"):
+    session_id: str
+    user_id: Optional[str] = None
+    anonymous_id: Optional[str] = None
+    ended_at: Optional[str] = None
+
+
+def msgspec_request_body(body_type: type) -> Dict[str, Any]:
+    """openapi_extra documenting a request body that the handler decodes with msgspec"""
+    # Inline the struct's schema: msgspec.json.schema() refers to it through
+    # "#/$defs/...", which doesn't resolve inside an OpenAPI document
+    _, components = msgspec.json.schema_components([body_type])
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": components[body_type.__name__]}},
+            "required": True,
+        }
+    }
+
+
+# SDK result fields whose API name isn't the plain camelCase of the field name
+_CAMEL_KEY_OVERRIDES = {"from_did": "from"}
+
+
+@lru_cache(maxsize=None)
+def _camel_fields(result_type: type) -> Tuple[Tuple[str, str], ...]:
+    """(field name, API key) pairs for an SDK result dataclass, computed once per type"""
+    return tuple(
+        (field.name, _CAMEL_KEY_OVERRIDES.get(field.name) or to_camel(field.name))
+        for field in dataclasses.fields(result_type)
+    )
+
+
+def camel_dict(result: Any) -> Dict[str, Any]:
+    """Shallow camelCase dict of an SDK result dataclass"""
+    return {key: getattr(result, name) for name, key in _camel_fields(type(result))}
+
+
+def msgspec_response(content: Any) -> Response:
+    """JSON response encoded with msgspec, bypassing FastAPI's response handling"""
+    return Response(content=msgspec.json.encode(content), media_type="application/json")
+
+
+def _invalid_body_response(error: msgspec.DecodeError) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=422,
+        content={"detail": str(error)},
+    )
 
 
-class EndSessionRequest(BaseModel):
-    session_id: str = Field(..., alias="sessionId")
-    user_id: Optional[str] = Field(None, alias="userId")
-    anonymous_id: Optional[str] = Field(None, alias="anonymousId")
-    ended_at: Optional[str] = Field(None, alias="endedAt")
+def _authentication_error_response(error: AuthenticationError) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=error.status_code or status.HTTP_401_UNAUTHORIZED,
+        content={
+            "error": str(error),
+            "type": "AuthenticationError",
+            "isAPIKeyError": error.is_api_key_error,
+        },
+    )
+
+
+def _network_error_response(error: NetworkError) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        content={"error": str(error), "type": "NetworkError", "code": error.code},
+    )
+
+
+def _server_error_response(error: ServerError) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=error.status_code or status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={"error": str(error), "type": "ServerError"},
+    )
+
+
+def _sdk_error_response(error: DCIDServerSDKError) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=error.status_code or status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={"error": str(error), "type": "SDKError"},
+    )
+
+
+def _unknown_error_response(error: Exception) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={"error": str(error), "type": "UnknownError"},
+    )
+
+
+_ERROR_RESPONSES: Dict[type, Callable[[Any], ORJSONResponse]] = {
+    msgspec.DecodeError: _invalid_body_response,
+    AuthenticationError: _authentication_error_response,
+    NetworkError: _network_error_response,
+    ServerError: _server_error_response,
+    DCIDServerSDKError: _sdk_error_response,
+}
+
+
+@lru_cache(maxsize=64)
+def _error_response_for(error_type: type) -> Callable[[Any], ORJSONResponse]:
+    """Response builder for the closest registered base class of an error type"""
+    for cls in error_type.__mro__:
+        builder = _ERROR_RESPONSES.get(cls)
+        if builder is not None:
+            return builder
+    return _unknown_error_response
 
 
 def handle_sdk_error(error: Exception):
     """Handle SDK errors and return appropriate HTTP responses"""
-    # Debug: print full error details
-    print(f"SDK Error: {type(error).__name__}: {error}")
-    if hasattr(error, 'context') and error.context:
-        print(f"  Context: url={error.context.url}, status={error.context.status_code}, source={error.context.error_source}")
-
-    if isinstance(error, AuthenticationError):
-        return JSONResponse(
-            status_code=error.status_code or status.HTTP_401_UNAUTHORIZED,
-            content={
-                "error": str(error),
-                "type": "AuthenticationError",
-                "isAPIKeyError": error.is_api_key_error,
-            },
-        )
-    elif isinstance(error, NetworkError):
-        return JSONResponse(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            content={"error": str(error), "type": "NetworkError", "code": error.code},
-        )
-    elif isinstance(error, ServerError):
-        return JSONResponse(
-            status_code=error.status_code or status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"error": str(error), "type": "ServerError"},
-        )
-    elif isinstance(error, DCIDServerSDKError):
-        return JSONResponse(
-            status_code=error.status_code or status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"error": str(error), "type": "SDKError"},
-        )
-    else:
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"error": str(error), "type": "UnknownError"},
-        )
+    # Debug: log full error details (checked first to skip formatting when disabled)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("SDK Error: %s: %s", type(error).__name__, error)
+        context = getattr(error, "context", None)
+        if context:
+            logger.debug(
+                "  Context: url=%s, status=%s, source=%s",
+                context.url, context.status_code, context.error_source,
+            )
+
+    return _error_response_for(type(error))(error)
+
+
+def sdk_route(handler: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Decorator turning exceptions raised by a route handler into error responses"""
+
+    @wraps(handler)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return await handler(*args, **kwargs)
+        except Exception as e:
+            return handle_sdk_error(e)
+
+    return wrapper
 
 
 @app.get("/health")
-def health():
+async def health():
     """Health check endpoint"""
     return {"status": "ok", "service": "dcid-server-sdk-test-server"}
 
 
+# The SDK client is blocking, so route handlers run its calls through
+# asyncio.to_thread to keep the event loop free while waiting on the backend
+
 # ============================================================================
 # AUTH ROUTES (client SDK compatible)
 # ============================================================================
 
-@app.post("/api/auth/sign-in/initiate")
-def sign_in_initiate(request: RegisterOTPRequest):
+auth_router = APIRouter(prefix="/api/auth")
+
+
+@auth_router.post("/sign-in/initiate")
+@sdk_route
+async def sign_in_initiate(request: RegisterOTPRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Initiate sign-in with OTP"""
-    try:
-        result = sdk.auth.register_otp(
-            InitiateOTPOptions(email=request.email, phone=request.phone)
-        )
-        return {"otp": result.otp}
-    except Exception as e:
-        return handle_sdk_error(e)
+    result = await asyncio.to_thread(
+        sdk.auth.register_otp,
+        InitiateOTPOptions(email=request.email, phone=request.phone)
+    )
+    return {"otp": result.otp}
 
 
-@app.post("/api/auth/sign-in/confirm")
-def sign_in_confirm(request: ConfirmOTPRequest):
+@auth_router.post("/sign-in/confirm")
+@sdk_route
+async def sign_in_confirm(request: ConfirmOTPRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Confirm sign-in with OTP"""
-    try:
-        tokens = sdk.auth.confirm_otp(
-            ConfirmOTPOptions(
-                email=request.email, phone=request.phone, otp=request.otp
-            )
+    tokens = await asyncio.to_thread(
+        sdk.auth.confirm_otp,
+        ConfirmOTPOptions(
+            email=request.email, phone=request.phone, otp=request.otp
         )
-        sdk.set_tokens(tokens)
-        return {
-            "access_token": tokens.access_token,
-            "refresh_token": tokens.refresh_token,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    )
+    return {
+        "access_token": tokens.access_token,
+        "refresh_token": tokens.refresh_token,
+    }
 
 
-@app.post("/api/auth/admin-login")
-def admin_login(request: RegisterOTPRequest):
+@auth_router.post("/admin-login")
+@sdk_route
+async def admin_login(request: RegisterOTPRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Admin login endpoint"""
-    try:
-        result = sdk.auth.admin_login(
-            InitiateOTPOptions(email=request.email, phone=request.phone)
-        )
-        return {"otp": result.otp}
-    except Exception as e:
-        return handle_sdk_error(e)
+    result = await asyncio.to_thread(
+        sdk.auth.admin_login,
+        InitiateOTPOptions(email=request.email, phone=request.phone)
+    )
+    return {"otp": result.otp}
 
 
-@app.post("/api/auth/token/refresh")
-def token_refresh(request: RefreshTokenRequest):
+@auth_router.post("/token/refresh")
+@sdk_route
+async def token_refresh(request: RefreshTokenRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Refresh token endpoint"""
-    try:
-        tokens = sdk.auth.refresh_token(
-            RefreshTokenOptions(refresh_token=request.refresh_token)
-        )
-        sdk.set_tokens(tokens)
-        return {
-            "access_token": tokens.access_token,
-            "refresh_token": tokens.refresh_token,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    tokens = await asyncio.to_thread(
+        sdk.auth.refresh_token,
+        RefreshTokenOptions(refresh_token=request.refresh_token)
+    )
+    return {
+        "access_token": tokens.access_token,
+        "refresh_token": tokens.refresh_token,
+    }
 
 
 # ============================================================================
 # IDENTITY - ENCRYPTION ROUTES (client SDK compatible)
 # ============================================================================
 
-@app.post("/api/identity/get-encrypted-key")
-def get_encrypted_key(request: GetEncryptedKeyRequest, authorization: Optional[str] = Header(None)):
+# Every identity route acts on behalf of the caller's bearer token
+identity_router = APIRouter(prefix="/api/identity", dependencies=[Depends(set_auth_from_request)])
+
+
+@identity_router.post("/get-encrypted-key")
+@sdk_route
+async def get_encrypted_key(request: GetEncryptedKeyRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Get encrypted key endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.encryption.get_key(
-            GetEncryptedKeyOptions(did=request.did)
-        )
-        return {
-            "encryptedKey": result.encrypted_key,
-            "did": result.did,
-            "message": result.message,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    result = await asyncio.to_thread(
+        sdk.identity.encryption.get_key,
+        GetEncryptedKeyOptions(did=request.did)
+    )
+    return camel_dict(result)
 
 
-@app.post("/api/identity/generate-encrypted-key")
-def generate_encrypted_key(request: GenerateEncryptionKeyRequest, authorization: Optional[str] = Header(None)):
+@identity_router.post("/generate-encrypted-key")
+@sdk_route
+async def generate_encrypted_key(request: GenerateEncryptionKeyRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Generate encryption key endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.encryption.generate_key(
-            GenerateEncryptionKeyOptions(
-                did=request.did, owner_email=request.owner_email
-            )
+    result = await asyncio.to_thread(
+        sdk.identity.encryption.generate_key,
+        GenerateEncryptionKeyOptions(
+            did=request.did, owner_email=request.owner_email
         )
-        return {
-            "encryptedKey": result.encrypted_key,
-            "did": result.did,
-            "ownerEmail": result.owner_email,
-            "message": result.message,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    )
+    return camel_dict(result)
 
 
 # ============================================================================
 # IDENTITY - ISSUER ROUTES
 # ============================================================================
 
-@app.post("/api/identity/issuer/issue-credential")
-def issue_credential(request: IssueCredentialRequest, authorization: Optional[str] = Header(None)):
+@identity_router.post("/issuer/issue-credential")
+@sdk_route
+async def issue_credential(request: IssueCredentialRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Issue credential endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.issuer.issue_credential(
-            IssueCredentialOptions(
-                did=request.did,
-                credential_name=request.credential_name,
-                values=request.values,
-                owner_email=request.owner_email,
-            )
+    result = await asyncio.to_thread(
+        sdk.identity.issuer.issue_credential,
+        IssueCredentialOptions(
+            did=request.did,
+            credential_name=request.credential_name,
+            values=request.values,
+            owner_email=request.owner_email,
         )
-        # Convert Python snake_case keys back to camelCase for API consistency
-        if "qr_code_link" in result:
-            return {"qrCodeLink": result["qr_code_link"], "schemaType": result["schema_type"]}
-        else:
-            return {"txId": result["tx_id"], "claimId": result["claim_id"]}
-    except Exception as e:
-        return handle_sdk_error(e)
+    )
+    # The issuer returns a snake_case dict rather than a dataclass
+    return {to_camel(key): value for key, value in result.items()}
 
 
-@app.get("/api/identity/issuer/get-credential-offer")
-def get_credential_offer(claimId: str, txId: str, authorization: Optional[str] = Header(None)):
+@identity_router.get("/issuer/get-credential-offer")
+@sdk_route
+async def get_credential_offer(claimId: str, txId: str, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Get credential offer endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.issuer.get_credential_offer(
-            GetCredentialOfferOptions(claim_id=claimId, tx_id=txId)
-        )
-        return {
-            "status": result.status,
-            "txId": result.tx_id,
-            "claimId": result.claim_id,
-            "offerAvailable": result.offer_available,
-            "qrCodeLink": result.qr_code_link,
-            "offer": result.offer,
-            "message": result.message,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    result = await asyncio.to_thread(
+        sdk.identity.issuer.get_credential_offer,
+        GetCredentialOfferOptions(claim_id=claimId, tx_id=txId)
+    )
+    return camel_dict(result)
 
 
 # ============================================================================
 # IDENTITY - IPFS ROUTES
 # ============================================================================
 
-@app.post("/api/identity/ipfs/store-credential")
-def store_credential(request: StoreCredentialRequest, authorization: Optional[str] = Header(None)):
+@identity_router.post("/ipfs/store-credential")
+@sdk_route
+async def store_credential(request: StoreCredentialRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Store credential endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.ipfs.store_credential(
-            StoreCredentialOptions(
-                did=request.did,
-                credential_type=request.credential_type,
-                credential=request.credential,
-                encrypted=request.encrypted,
-            )
+    result = await asyncio.to_thread(
+        sdk.identity.ipfs.store_credential,
+        StoreCredentialOptions(
+            did=request.did,
+            credential_type=request.credential_type,
+            credential=request.credential,
+            encrypted=request.encrypted,
         )
-        return {
-            "cid": result.cid,
-            "did": result.did,
-            "credentialType": result.credential_type,
-            "message": result.message,
-            "encrypted": result.encrypted,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    )
+    return camel_dict(result)
 
 
-@app.post("/api/identity/ipfs/retrieve-user-credential")
-def retrieve_user_credential(request: RetrieveUserCredentialRequest, authorization: Optional[str] = Header(None)):
+@identity_router.post("/ipfs/retrieve-user-credential")
+@sdk_route
+async def retrieve_user_credential(request: RetrieveUserCredentialRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Retrieve user credential endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.ipfs.retrieve_user_credential(
-            RetrieveUserCredentialOptions(
-                did=request.did,
-                credential_type=request.credential_type,
-                include_cid_only=request.include_cid_only,
-            )
+    result = await asyncio.to_thread(
+        sdk.identity.ipfs.retrieve_user_credential,
+        RetrieveUserCredentialOptions(
+            did=request.did,
+            credential_type=request.credential_type,
+            include_cid_only=request.include_cid_only,
         )
-        return {
-            "cid": result.cid,
-            "did": result.did,
-            "credentialType": result.credential_type,
-            "message": result.message,
-            "credential": result.credential,
-            "encrypted": result.encrypted,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    )
+    # Credential payloads can be large: return a ready-made response so FastAPI
+    # skips jsonable_encoder's recursive walk over them
+    return ORJSONResponse(camel_dict(result))
 
 
 # Client SDK compatible route
-@app.post("/api/identity/get-all-user-credentials")
-def get_all_user_credentials(request: GetAllUserCredentialsRequest, authorization: Optional[str] = Header(None)):
+@identity_router.post("/get-all-user-credentials")
+@sdk_route
+async def get_all_user_credentials(request: GetAllUserCredentialsRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Get all user credentials endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.ipfs.get_all_user_credentials(
-            GetAllUserCredentialsOptions(
-                did=request.did,
-                include_credential_data=request.include_credential_data,
-            )
+    result = await asyncio.to_thread(
+        sdk.identity.ipfs.get_all_user_credentials,
+        GetAllUserCredentialsOptions(
+            did=request.did,
+            include_credential_data=request.include_credential_data,
         )
-        return {
-            "credentials": result.credentials,
-            "did": result.did,
-            "count": result.count,
-            "message": result.message,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    )
+    return ORJSONResponse(camel_dict(result))
 
 
 # ============================================================================
 # IDENTITY - VERIFICATION ROUTES (client SDK compatible)
 # ============================================================================
 
-@app.post("/api/identity/verify/sign-in")
-def verify_sign_in(request: VerifySignInRequest, authorization: Optional[str] = Header(None)):
+@identity_router.post("/verify/sign-in")
+@sdk_route
+async def verify_sign_in(request: VerifySignInRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Verify sign-in endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.verification.verify_sign_in(
-            VerifySignInOptions(credential_name=request.credential_name)
-        )
-        return {
-            "proofRequestUrl": result.proof_request_url,
-            "iden3commUrl": result.iden3comm_url,
-            "sessionId": result.session_id,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    result = await asyncio.to_thread(
+        sdk.identity.verification.verify_sign_in,
+        VerifySignInOptions(credential_name=request.credential_name)
+    )
+    return camel_dict(result)
 
 
-@app.get("/api/identity/verification/link-store")
-def get_link_store(id: str, authorization: Optional[str] = Header(None)):
+@identity_router.get("/verification/link-store")
+@sdk_route
+async def get_link_store(id: str, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Get link store endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.verification.get_link_store(GetLinkStoreOptions(id=id))
-        return {
-            "id": result.id,
-            "thid": result.thid,
-            "type": result.type,
-            "from": result.from_did,
-            "typ": result.typ,
-            "body": result.body,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    result = await asyncio.to_thread(
+        sdk.identity.verification.get_link_store, GetLinkStoreOptions(id=id)
+    )
+    return camel_dict(result)
 
 
-@app.post("/api/identity/verification/link-store")
-def post_link_store(request: PostLinkStoreRequest, authorization: Optional[str] = Header(None)):
+@identity_router.post("/verification/link-store")
+@sdk_route
+async def post_link_store(request: PostLinkStoreRequest, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Post link store endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.verification.post_link_store(
-            PostLinkStoreOptions(
-                id=request.id,
-                thid=request.thid,
-                type=request.type,
-                from_did=request.from_did,
-                typ=request.typ,
-                body=request.body,
-            )
+    result = await asyncio.to_thread(
+        sdk.identity.verification.post_link_store,
+        PostLinkStoreOptions(
+            id=request.id,
+            thid=request.thid,
+            type=request.type,
+            from_did=request.from_did,
+            typ=request.typ,
+            body=request.body,
         )
-        return {
-            "proofRequestUrl": result.proof_request_url,
-            "iden3commUrl": result.iden3comm_url,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    )
+    return camel_dict(result)
 
 
-@app.post("/api/identity/verification/callback")
-def verify_callback(request: VerifyCallbackRequest, sessionId: str, authorization: Optional[str] = Header(None)):
+@identity_router.post("/verification/callback")
+@sdk_route
+async def verify_callback(request: VerifyCallbackRequest, sessionId: str, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Verify callback endpoint"""
-    try:
-        set_auth_from_request(authorization)
-        result = sdk.identity.verification.verify_callback(
-            VerifyCallbackOptions(session_id=sessionId, token=request.token)
-        )
-        return {
-            "id": result.id,
-            "typ": result.typ,
-            "type": result.type,
-            "thid": result.thid,
-            "body": result.body,
-            "from": result.from_did,
-            "to": result.to,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    result = await asyncio.to_thread(
+        sdk.identity.verification.verify_callback,
+        VerifyCallbackOptions(session_id=sessionId, token=request.token)
+    )
+    return camel_dict(result)
 
 
 # ============================================================================
 # ANALYTICS ROUTES
 # ============================================================================
 
-@app.post("/api/analytics/start-session")
-def start_session(request: StartSessionRequest):
+analytics_router = APIRouter(prefix="/api/analytics")
+
+
+@analytics_router.post("/start-session", openapi_extra=msgspec_request_body(StartSessionBody))
+@sdk_route
+async def start_session(request: Request, sdk: DCIDServerSDK = Depends(get_sdk)):
     """Start session endpoint"""
-    try:
-        result = sdk.analytics.start_session(
-            StartSessionEvent(
-                user_id=request.user_id,
-                anonymous_id=request.anonymous_id,
-                page_location=request.page_location,
-                session_id=request.session_id,
-            )
+    body = msgspec.json.decode(await request.body(), type=StartSessionBody)
+    result = await asyncio.to_thread(
+        sdk.analytics.start_session,
+        StartSessionEvent(
+            user_id=body.user_id,
+            anonymous_id=body.anonymous_id,
+            page_location=body.page_location,
+            session_id=body.session_id,
         )
-        return {
-            "success": result.success,
-            "session_id": result.session_id,
-            "timestamp": result.timestamp,
-            "anonymous_id": result.anonymous_id,
-            "linked": result.linked,
-        }
-    except Exception as e:
-        return handle_sdk_error(e)
+    )
+    return msgspec_response({
+        "success": result.success,
+        "session_id": result.session_id,
+        "timestamp": result.timestamp,
+        "anonymous_id": result.anonymous_id,
+        "linked": result.linked,
+    })
+
+
+@analytics_router.post("/end-session", openapi_extra=msgspec_request_body(EndSessionBody))
+@sdk_route
+async def end_session(request: Request):
+    """End session endpoint (the event is queued and sent in the background)"""
+    body = msgspec.json.decode(await request.body(), type=EndSessionBody)
+    if not body.session_id:
+        raise ValueError("session_id is required for end_session event")
+    await request.app.state.analytics_queue.put(
+        EndSessionEvent(
+            session_id=body.session_id,
+            user_id=body.user_id,
+            anonymous_id=body.anonymous_id,
+            ended_at=body.ended_at,
+        )
+    )
+    return msgspec_response({"success": True, "queued": True})
 
 
-@app.post("/api/analytics/end-session")
-def end_session(request: EndSessionRequest):
-    """End session endpoint"""
-    try:
-        result = sdk.analytics.end_session(
-            EndSessionEvent(
-                session_id=request.session_id,
-                user_id=request.user_id,
-                anonymous_id=request.anonymous_id,
-                ended_at=request.ended_at,
-            )
-        )
-        return {"success": result.success, "timestamp": result.timestamp}
-    except Exception as e:
-        return handle_sdk_error(e)
+app.include_router(auth_router)
+app.include_router(identity_router)
+app.include_router(analytics_router)
 
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "8080"))
+    # On a free-threaded build (e.g. python3.13t) one process already runs the
+    # SDK's worker threads in parallel, so default to a single worker there
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    default_workers = (os.cpu_count() or 1) if gil_enabled else 1
+    workers = int(os.getenv("WEB_CONCURRENCY", str(default_workers)))
+    limit_concurrency = os.getenv("LIMIT_CONCURRENCY")
     print("===========================================")
     print("DCID Server SDK Test Server (Python)")
     print("===========================================")
-    print(f"Environment: {environment}")
+    print(f"Environment: {config.environment}")
     print(f"Port: {port}")
+    print(f"Workers: {workers}")
+    print(f"GIL: {'enabled' if gil_enabled else 'disabled'}")
     print(f"Health check: http://localhost:{port}/health")
     print("===========================================")
     print("Server is running and ready for requests...")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Each worker is a separate process with its own SDK client and connection pool
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        limit_concurrency=int(limit_concurrency) if limit_concurrency else None,
+        loop="auto",
+        http="auto",
+        log_level="warning",
+    )